@@ -79,6 +79,13 @@ HEADERS = {
     "Referer": "https://fubon-ebrokerdj.fbs.com.tw/",
 }
 
+# 併發抓取：同時處理的目標數 / 同時對富邦站發出的請求上限
+SCRAPE_WORKERS = 8
+HTTP_MAX_INFLIGHT = 4
+
+# 開發除錯用：>0 時以 requests-cache 快取 GET 回應 N 秒（存於 out/http_cache.sqlite；需另裝 requests-cache）
+HTTP_CACHE_TTL = 0
+
 # ── 通知設定 ───────────────────────────────────────────────
 # 可放多個 Webhook；留空代表不發送
 DISCORD_WEBHOOKS = {
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import time
 import platform
 from pathlib import Path
@@ -15,12 +16,15 @@ def _housekeep_out():
     """依 config 設定清理 out 目錄的 fubon_*.json。"""
     p = Path(config.OUT_DIR)
     p.mkdir(parents=True, exist_ok=True)
-    files = sorted(p.glob("fubon_*.json"))
+    # 檔名即時間戳（fubon_YYYYmmdd_HHMMSS.json）→ 依檔名排序就是新舊順序；scandir 單次掃描、不逐檔 stat
+    with os.scandir(p) as it:
+        files = sorted(e.path for e in it
+                       if e.name.startswith("fubon_") and e.name.endswith(".json") and e.is_file())
 
     if getattr(config, "OUT_CLEAN_BEFORE_RUN", False):
         for f in files:
             try:
-                f.unlink()
+                os.remove(f)
             except Exception as e:
                 print(f"⚠️ 無法刪除 {f}: {e}")
         return
@@ -30,7 +34,7 @@ def _housekeep_out():
         to_delete = files[:-max_keep]
         for f in to_delete:
             try:
-                f.unlink()
+                os.remove(f)
             except Exception as e:
                 print(f"⚠️ 無法刪除 {f}: {e}")
 
@@ -1,10 +1,12 @@
 # fubon_scraper/extractors.py
 import re
-from io import StringIO
-from typing import List, Optional
+from functools import lru_cache
+from html import unescape
+from typing import Dict, List, Optional, Tuple
 
+import lxml.html
 import pandas as pd
-from bs4 import BeautifulSoup
+from lxml import etree
 
 from .utils import RE_CODE
 
@@ -14,25 +16,95 @@ RE_CODEJS    = re.compile(r"GenLink2stk\('[^']*?(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)
 RE_CODE_NAME = re.compile(
     r"(?<![0-9A-Za-zＡ-Ｚａ-ｚ])(?P<code>\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)(?![0-9A-Za-zＡ-Ｚａ-ｚ])\s*[，,\s]*\s*(?P<name>[\u4e00-\u9fffA-Za-z0-9\-\._]+)"
 )
+RE_WS        = re.compile(r"\s+")
+# 逐列比對 RE_CODE_NAME 前的預檢：整列沒有數字就不可能有代號
+RE_HAS_DIGIT = re.compile(r"\d")
+# onclick 快速路徑：onclick="...GenLink2stk('..代號'..." 的標籤，且標籤內只有純文字、直接接結束標籤
+RE_ONCLICK_PAIR = re.compile(
+    r"""(?i:onclick)\s*=\s*"[^"]*?GenLink2stk\('\D*?(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)'[^"]*"[^>]*>([^<]*)</"""
+)
+# 值內含 GenLink2stk 的 onclick 屬性總數（依引號切出屬性值，值裡有 > 也算得到）：與 RE_ONCLICK_PAIR 命中數不符就走 lxml
+RE_ONCLICK_ANY = re.compile(
+    r"""(?i:onclick)\s*=\s*(?:"[^"]*?GenLink2stk|'[^']*?GenLink2stk|[^\s>]*GenLink2stk)"""
+)
+# extract_from_tables 預檢：頁面沒有 <table> 就不必建樹
+RE_TABLE_TAG = re.compile(r"<table\b", re.IGNORECASE)
+# extract_zgb_side 專用
+RE_ZGB_JS    = re.compile(r"\('([^']*?(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?))'\s*,\s*'([^']+)'\)")
+RE_A_TEXT    = re.compile(r"^(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)\s*(.+)$")
+RE_CODE_FULL = re.compile(r"\d{4,6}[A-Za-z]?")
+# 區塊標記（容許標籤內前後空白）；只有買超/賣超兩種，預先編好
+RE_SIDE_MARK = {side: re.compile(rf"> *{side} *<") for side in ("買超", "賣超")}
+
+# 直接用 lxml 解析（比 BeautifulSoup 包一層快許多）；先轉 UTF-8 bytes，避開 <?xml encoding?> 宣告的限制
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def _build_tree(html: str) -> Optional[etree._Element]:
+    """解析 HTML 為 lxml 樹；空文件回傳 None"""
+    try:
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+    except etree.ParserError:
+        return None
+
+
+@lru_cache(maxsize=16)
+def _parse_html(html: str) -> Optional[etree._Element]:
+    """整頁解析（快取）：parse_codes_generic 會讓多個 extractor 依序處理同一份 HTML，只解析一次；樹只讀不改"""
+    return _build_tree(html)
+
+
+def clear_parse_caches() -> None:
+    """釋放解析快取（整頁 HTML 字串與 lxml 樹）；每輪抓取結束後呼叫，避免常駐排程一直佔著記憶體"""
+    _parse_html.cache_clear()
+    _compact_html.cache_clear()
+
+
+def _node_text(node: etree._Element, sep: str = "") -> str:
+    """節點內文字（略過 script/style），每段先 strip 再以 sep 串接"""
+    parts = (t.strip() for t in node.xpath(".//text()[not(ancestor::script or ancestor::style)]"))
+    return sep.join(t for t in parts if t)
+
+
+def _clean_frame(rows) -> pd.DataFrame:
+    """把已清理好的 (代號, 名稱) 轉成 DataFrame，並標記 attrs["cleaned"] 讓 parse_codes_generic 不再重跑 regex"""
+    # 建表前先以 dict 去重（保留首次出現順序），不必再跑 drop_duplicates 建一次 hash index
+    df = pd.DataFrame(list(dict.fromkeys(rows)), columns=["代號", "名稱"])
+    df.attrs["cleaned"] = True
+    return df
 
 
 def extract_from_onclick(html: str) -> Optional[pd.DataFrame]:
     """從 onclick=GenLink2stk(...) 抽出代號/名稱"""
-    soup = BeautifulSoup(html, "lxml")
+    # 快速路徑：每個 onclick 節點都是「標籤 + 純文字 + 結束標籤」時，一次 regex 掃描即可，不必建樹；
+    # 只要有節點內含巢狀標籤（如 <b>名稱</b>）或引號/編碼不規整而對不上，整頁改走 lxml
+    pairs = RE_ONCLICK_PAIR.findall(html)
+    if (pairs and len(pairs) == len(RE_ONCLICK_ANY.findall(html))
+            and all(text.strip() for _, text in pairs)):
+        rows = []
+        for code, text in pairs:
+            name = unescape(text).strip().removeprefix(code).lstrip()
+            rows.append((code, RE_WS.sub("", name)))
+        return _clean_frame(rows)
+
+    # 保底：有巢狀標籤/實體編碼等不規整情況時，走 lxml
+    root = _parse_html(html)
+    if root is None:
+        return None
     rows = []
-    for node in soup.find_all(onclick=RE_ONCLICK):
-        m = RE_ONCLICK.search(node.get("onclick", ""))
+    for node in root.xpath("//*[@onclick]"):
+        m = RE_ONCLICK.search(node.get("onclick"))
         if not m:
             continue
         code = m.group(1)
-        name = node.get_text(strip=True)
+        name = _node_text(node)
         if not name:
             continue
-        name = re.sub(rf"^{code}\s*", "", name)
-        rows.append((code, name))
+        name = name.removeprefix(code).lstrip()
+        rows.append((code, RE_WS.sub("", name)))
     if not rows:
         return None
-    return pd.DataFrame(rows, columns=["代號", "名稱"]).drop_duplicates()
+    return _clean_frame(rows)
 
 
 def extract_from_js(html: str) -> Optional[pd.DataFrame]:
@@ -40,57 +112,103 @@ def extract_from_js(html: str) -> Optional[pd.DataFrame]:
     items = RE_CODEJS.findall(html)
     if not items:
         return None
-    rows = [(c, n.strip()) for c, n in items if n.strip()]
+    rows = [(c, RE_WS.sub("", n)) for c, n in items if n.strip()]
     if not rows:
         return None
-    return pd.DataFrame(rows, columns=["代號", "名稱"]).drop_duplicates()
+    return _clean_frame(rows)
+
+
+def _span(td: etree._Element, attr: str) -> int:
+    """儲存格的 colspan/rowspan（缺少或格式錯誤視為 1）"""
+    try:
+        return max(1, int(td.get(attr, 1)))
+    except ValueError:
+        return 1
+
+
+def _take_carry(carry: Dict[int, Tuple[str, int]], col: int) -> str:
+    """取出上方 rowspan 延續到此欄的文字，並扣掉一列"""
+    text, left = carry[col]
+    if left > 1:
+        carry[col] = (text, left - 1)
+    else:
+        del carry[col]
+    return text
+
+
+def _table_rows(table: etree._Element) -> List[List[str]]:
+    """
+    表格本身各列的儲存格文字（不含巢狀表格的列）。
+    colspan 依跨欄數重複、rowspan 往下延續到後續列，欄位位置與 pd.read_html 一致。
+    """
+    rows = []
+    carry: Dict[int, Tuple[str, int]] = {}  # 欄位 → (文字, 還要往下延續的列數)
+    for tr in table.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr"):
+        cells: List[str] = []
+        for td in tr.xpath("./td | ./th"):
+            while len(cells) in carry:
+                cells.append(_take_carry(carry, len(cells)))
+            text = _node_text(td, " ")
+            rowspan = _span(td, "rowspan")
+            for _ in range(_span(td, "colspan")):
+                if rowspan > 1:
+                    carry[len(cells)] = (text, rowspan - 1)
+                cells.append(text)
+        # 本列儲存格用完後，右側仍有延續的欄位依序補上
+        for col in sorted(carry):
+            if col >= len(cells):
+                cells.append(_take_carry(carry, col))
+        if any(cells):
+            rows.append(cells)
+    return rows
 
 
 def extract_from_tables(html: str) -> Optional[pd.DataFrame]:
-    """從 <table> 嘗試讀取，找有「代號」「名稱」欄位的表格"""
-    soup = BeautifulSoup(html, "lxml")
-    tables = soup.find_all("table")
-    candidates: List[pd.DataFrame] = []
-    for t in tables:
-        try:
-            df = pd.read_html(StringIO(str(t)))[0]
-            if not df.empty:
-                candidates.append(df)
-        except Exception:
-            continue
-    if not candidates:
+    """從 <table> 嘗試讀取，找有「代號」「名稱」欄位的表格（直接走 lxml 列，不經 pd.read_html）"""
+    if not RE_TABLE_TAG.search(html):
+        return None
+    root = _parse_html(html)
+    if root is None:
+        return None
+    tables = [rows for rows in (_table_rows(t) for t in root.iter("table")) if rows]
+    if not tables:
         return None
 
-    # 嘗試對應欄位
-    for df in candidates:
-        cols = [str(c).strip() for c in df.columns]
-        has_code = any("代號" in c or "證券代號" in c for c in cols)
-        has_name = any("名稱" in c or "股票名稱" in c or "證券名稱" in c for c in cols)
-        if has_code and has_name:
-            df.columns = cols
-            colmap = {}
-            for c in cols:
-                if "代號" in c or "證券代號" in c:
-                    colmap["代號"] = c
-                if "名稱" in c or "股票名稱" in c or "證券名稱" in c:
-                    colmap["名稱"] = c
-            out = df.rename(columns={v: k for k, v in colmap.items()})[["代號", "名稱"]]
-            out["代號"] = out["代號"].astype(str).str.extract(RE_CODE)
-            out["名稱"] = out["名稱"].astype(str).str.replace(r"\s+", "", regex=True)
-            out = out.dropna().drop_duplicates()
-            if len(out) > 0:
-                return out.reset_index(drop=True)
+    # 嘗試對應欄位：找出含「代號」「名稱」的表頭列，取其後各列
+    for rows in tables:
+        for i, header in enumerate(rows):
+            code_idx = name_idx = None
+            for j, c in enumerate(header):
+                if "代號" in c:
+                    code_idx = j
+                if "名稱" in c:
+                    name_idx = j
+            if code_idx is None or name_idx is None:
+                continue
+            out = []
+            for cells in rows[i + 1:]:
+                if max(code_idx, name_idx) >= len(cells):
+                    continue
+                m = RE_CODE.search(cells[code_idx])
+                name = RE_WS.sub("", cells[name_idx])
+                if m and name:
+                    out.append((m.group(1), name))
+            if out:
+                return _clean_frame(out)
+            break
 
     # 保底：逐列找 4 碼數字 + 中文名稱
-    rows = []
-    for df in candidates:
-        for _, row in df.iterrows():
-            text = " ".join(str(v) for v in row.values)
+    found = []
+    for rows in tables:
+        for cells in rows:
+            text = " ".join(cells)
+            if not RE_HAS_DIGIT.search(text):
+                continue
             m = RE_CODE_NAME.search(text)
             if m:
-                rows.append((m.group("code"), m.group("name")))
-    if rows:
-        return pd.DataFrame(rows, columns=["代號", "名稱"]).drop_duplicates().reset_index(drop=True)
+                found.append((m.group("code"), m.group("name")))
+    if found:
+        return _clean_frame(found)
     return None
 
 
@@ -99,26 +217,37 @@ def parse_codes_generic(html: str) -> pd.DataFrame:
     for extractor in (extract_from_onclick, extract_from_js, extract_from_tables):
         df = extractor(html)
         if df is not None and len(df) > 0:
+            if df.attrs.get("cleaned"):
+                return df  # _clean_frame 已去重，且 regex 抽出的值不會是 NaN
             df = df[["代號", "名稱"]].copy()
             df["代號"] = df["代號"].astype(str).str.extract(RE_CODE)
-            df["名稱"] = df["名稱"].astype(str).str.replace(r"\s+", "", regex=True)
+            df["名稱"] = df["名稱"].astype(str).str.replace(RE_WS, "", regex=True)
             return df.dropna().drop_duplicates().reset_index(drop=True)
     raise ValueError("無法抽出代號/名稱 (generic)")
 
 
+@lru_cache(maxsize=8)
+def _compact_html(html: str) -> str:
+    """空白壓成單一空格（快取：同一頁的買超/賣超兩個目標共用同一份 HTML，只需算一次）"""
+    return RE_WS.sub(" ", html)
+
+
 def extract_zgb_side(html: str, side: str = "買超") -> pd.DataFrame:
     """
     只在指定 side（買超/賣超）區塊內抽出代號/名稱。
     依序「都」嘗試：JS 連結 / <a> 文字 / 表格 / 純文字，全合併後去重。
     支援 4–6 碼 + 可選英文字尾，並將全形字母正規化為半形。
     """
-    import unicodedata
-    compact = re.sub(r"\s+", " ", html)
+    # 便宜的子字串預檢：整頁沒有 side 字樣就不必做空白壓縮/切段
+    if side not in html:
+        raise ValueError(f"找不到『{side}』區塊標記")
+    compact = _compact_html(html)
 
     # 切出 side 片段
     start = compact.find(f">{side}<")
     if start == -1:
-        m = re.search(rf"> *{re.escape(side)} *<", compact)
+        pat = RE_SIDE_MARK.get(side) or re.compile(rf"> *{re.escape(side)} *<")
+        m = pat.search(compact)
         if m:
             start = m.start()
     if start == -1:
@@ -127,59 +256,43 @@ def extract_zgb_side(html: str, side: str = "買超") -> pd.DataFrame:
     other = "賣超" if side == "買超" else "買超"
     end = compact.find(f">{other}<", start + 1)
     segment = compact[start:end] if end != -1 else compact[start:]
-    seg_soup = BeautifulSoup(segment, "lxml")
+    seg_root = _build_tree(segment)  # segment 至少含 side 標記，不會是空文件
 
     rows: list[tuple[str, str]] = []
 
     # (1) 任意 JS 連結：('任意前綴+4~6碼(+字尾)','名稱')
-    rows += [(code, re.sub(r"\s+", "", name))
-             for _, code, name in re.findall(r"\('([^']*?(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?))'\s*,\s*'([^']+)'\)", segment)]
+    rows += [(code, RE_WS.sub("", name)) for _, code, name in RE_ZGB_JS.findall(segment)]
 
     # (2) <a> 文字： ^(代號)(名稱)
-    for a in seg_soup.find_all("a"):
-        text = a.get_text(" ", strip=True).replace("\xa0", " ")
-        m = re.match(r"^(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)\s*(.+)$", text)
+    for a in seg_root.iter("a"):
+        text = _node_text(a, " ").replace("\xa0", " ")
+        m = RE_A_TEXT.match(text)
         if m:
-            rows.append((m.group(1), re.sub(r"\s+", "", m.group(2))))
-
-    # (3) 表格掃描：很多 ETF/債券不是連結
-    from io import StringIO
-    import pandas as _pd
-    for t in seg_soup.find_all("table"):
-        try:
-            df = _pd.read_html(StringIO(str(t)))[0]
-        except Exception:
-            continue
-        for _, r in df.iterrows():
-            text = " ".join(str(v) for v in r.values)
+            rows.append((m.group(1), RE_WS.sub("", m.group(2))))
+
+    # (3) 表格掃描：很多 ETF/債券不是連結（直接走已建好的片段樹，不再經 pd.read_html 逐表建 DataFrame）
+    for table in seg_root.iter("table"):
+        for cells in _table_rows(table):
+            text = " ".join(cells)
+            if not RE_HAS_DIGIT.search(text):
+                continue
             m = RE_CODE_NAME.search(text)
             if m:
-                rows.append((m.group("code"), re.sub(r"\s+", "", m.group("name"))))
+                rows.append((m.group("code"), RE_WS.sub("", m.group("name"))))
 
     # (4) 純文字保底：把整段文字掃一次
-    plain = seg_soup.get_text(" ", strip=True)
+    plain = _node_text(seg_root, " ")
     for m in RE_CODE_NAME.finditer(plain):
-        rows.append((m.group("code"), re.sub(r"\s+", "", m.group("name"))))
+        rows.append((m.group("code"), RE_WS.sub("", m.group("name"))))
 
     if not rows:
         raise ValueError(f"{side}表沒有解析到任何股票")
 
-    # 清理 / 去重：標準化全形 → 半形，允許 4–6 碼 + 可選英文字尾
-    seen = set()
-    clean = []
-    for code, name in rows:
-        code = unicodedata.normalize("NFKC", str(code))  # 全形→半形
-        code = re.sub(r"\s+", "", code).upper()
-        if not re.fullmatch(r"\d{4,6}[A-Za-z]?", code):
-            continue
-        if code in seen:
-            continue
-        seen.add(code)
-        nm = str(name).replace("*", "").strip()
-        clean.append((code, nm))
-
-    import pandas as pd
-    df = pd.DataFrame(clean, columns=["代號", "名稱"]).dropna().reset_index(drop=True)
-    return df
+    # 清理 / 去重（整欄字串運算）：標準化全形 → 半形，允許 4–6 碼 + 可選英文字尾，同代號留第一筆
+    df = pd.DataFrame(rows, columns=["代號", "名稱"]).astype(str)
+    df["代號"] = df["代號"].str.normalize("NFKC").str.replace(RE_WS, "", regex=True).str.upper()
+    df["名稱"] = df["名稱"].str.replace("*", "", regex=False).str.strip()
+    df = df[df["代號"].str.fullmatch(RE_CODE_FULL)].drop_duplicates(subset="代號", keep="first")
+    return df.reset_index(drop=True)
 
 
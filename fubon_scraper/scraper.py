@@ -2,33 +2,46 @@
 import os
 import json
 import datetime as dt
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce
+from typing import Dict, List, Tuple, Union
 
 import pandas as pd
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 import config
 from .utils import (
     tw_today, parse_date_arg, requests_session, fetch_html,
     build_zgb_url, zgb_side_from_url,
 )
-from .extractors import parse_codes_generic, extract_zgb_side
+from .extractors import parse_codes_generic, extract_zgb_side, clear_parse_caches
 
 
 def _assert_membership(inter_df: pd.DataFrame, parents: List[pd.DataFrame], label: str) -> pd.DataFrame:
     """確保交集結果真的存在於所有父集合，否則刪除異常代號"""
     parent_sets = [set(p["代號"]) for p in parents]
-    keep, dropped = [], []
-    for _, r in inter_df.iterrows():
-        code = r["代號"]
-        if all(code in s for s in parent_sets):
-            keep.append(r)
-        else:
-            dropped.append(code)
+    allowed = set.intersection(*parent_sets) if parent_sets else set(inter_df["代號"])
+    mask = inter_df["代號"].isin(allowed)
+    dropped = inter_df.loc[~mask, "代號"].tolist()
     if dropped:
         print(f"[FIX] {label}: 移除不存在於全部父集合的代號 → {sorted(set(dropped))}")
-    if not keep:
-        return pd.DataFrame(columns=["代號", "名稱"])
-    return pd.DataFrame(keep, columns=["代號", "名稱"]).reset_index(drop=True)
+    return inter_df.loc[mask, ["代號", "名稱"]].reset_index(drop=True)
+
+
+def _first_names(dfs: List[pd.DataFrame], codes: Union[set, pd.Index]) -> Dict[str, str]:
+    """codes 中每個代號取第一個非空名稱（依 dfs 順序、列順序）"""
+    frames = [df[["代號", "名稱"]] for df in dfs if not df.empty]
+    if not frames:
+        return {}
+    combined = pd.concat(frames, ignore_index=True).astype(str)
+    combined["名稱"] = combined["名稱"].str.strip()
+    combined = combined[combined["代號"].isin(codes) & (combined["名稱"] != "")]
+    combined = combined.drop_duplicates(subset="代號", keep="first")
+    return dict(zip(combined["代號"], combined["名稱"]))
 
 
 def _triple_intersection(a: pd.DataFrame, b: pd.DataFrame, c: pd.DataFrame) -> pd.DataFrame:
@@ -37,13 +50,7 @@ def _triple_intersection(a: pd.DataFrame, b: pd.DataFrame, c: pd.DataFrame) -> p
     codes = sa & sb & sc
     if not codes:
         return pd.DataFrame(columns=["代號", "名稱"])
-    name_map: Dict[str, str] = {}
-    for df in (a, b, c):
-        for _, r in df.iterrows():
-            code = r["代號"]
-            nm = str(r["名稱"]).strip()
-            if code not in name_map and nm:
-                name_map[code] = nm
+    name_map = _first_names([a, b, c], codes)
     rows = [(code, name_map.get(code, "")) for code in sorted(codes)]
     return pd.DataFrame(rows, columns=["代號", "名稱"])
 
@@ -51,27 +58,24 @@ def _nway_intersection(dfs: List[pd.DataFrame]) -> pd.DataFrame:
     """N 個集合的交集（名稱以第一個出現者為準）。"""
     if not dfs:
         return pd.DataFrame(columns=["代號", "名稱"])
-    code_sets = [set(df["代號"]) for df in dfs if not df.empty]
-    if not code_sets:
+    # 交集在 pd.Index（C 層 hash table）上做，不必先為每個 df 建 Python set
+    code_idx = [pd.Index(df["代號"].astype(str).unique()) for df in dfs if not df.empty]
+    if not code_idx:
         return pd.DataFrame(columns=["代號", "名稱"])
-    inter_codes = set.intersection(*code_sets) if len(code_sets) > 1 else code_sets[0]
-    if not inter_codes:
+    inter_codes = reduce(lambda a, b: a.intersection(b), code_idx)
+    if inter_codes.empty:
         return pd.DataFrame(columns=["代號", "名稱"])
 
-    name_map: Dict[str, str] = {}
-    for df in dfs:
-        for _, r in df.iterrows():
-            code = str(r["代號"])
-            nm = str(r.get("名稱", "")).strip()
-            if code in inter_codes and code not in name_map and nm:
-                name_map[code] = nm
-    rows = [(code, name_map.get(code, "")) for code in sorted(inter_codes)]
+    name_map = _first_names(dfs, inter_codes)
+    rows = [(code, name_map.get(code, "")) for code in inter_codes.sort_values()]
     return pd.DataFrame(rows, columns=["代號", "名稱"])
 
 
 
 def _df_to_list(df: pd.DataFrame) -> List[Dict[str, str]]:
-    return [{"代號": str(r["代號"]), "名稱": str(r["名稱"])} for _, r in df.iterrows()]
+    codes = map(str, df["代號"].tolist())
+    names = map(str, df["名稱"].tolist())
+    return [{"代號": c, "名稱": n} for c, n in zip(codes, names)]
 
 
 def _scrape_group(name: str, url: str, session) -> pd.DataFrame:
@@ -83,13 +87,8 @@ def _scrape_group(name: str, url: str, session) -> pd.DataFrame:
     else:
         df = parse_codes_generic(html)
 
-    df = df[["代號", "名稱"]].copy()
-    df["代號"], df["名稱"] = df["代號"].astype(str), df["名稱"].astype(str)
-    df = df.dropna().drop_duplicates().reset_index(drop=True)
-
-    if name.startswith("ZGB_"):
-        print("[DBG]", name, "first10=", df["代號"].head(10).tolist())
-    return df
+    # extractor 輸出的兩欄已是字串，不再整欄 astype(str) 複製一份
+    return df[["代號", "名稱"]].dropna().drop_duplicates().reset_index(drop=True)
 
 
 def run_scraper(out_dir: str, date: str | None = None, simple: bool = False) -> str:
@@ -113,16 +112,30 @@ def run_scraper(out_dir: str, date: str | None = None, simple: bool = False) ->
         params = extra.get("params", {})
         targets.append((f"ZGB_{label}", build_zgb_url(params, target_date)))
 
-    # 抓取
+    # 抓取（多執行緒共用同一個 session；實際併發請求數由 utils._get 控管）
     data: Dict[str, pd.DataFrame] = {}
-    for name, url in targets:
-        try:
-            df = _scrape_group(name, url, session)
-            data[name] = df
+    errors: Dict[str, Exception] = {}
+    workers = max(1, min(getattr(config, "SCRAPE_WORKERS", 8), len(targets)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_scrape_group, name, url, session): name for name, url in targets}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                data[name] = fut.result()
+            except Exception as e:
+                errors[name] = e
+                data[name] = pd.DataFrame(columns=["代號", "名稱"])
+    # 解析快取只在同一輪內有用（同頁多個 extractor / 買超賣超共用），抓完即釋放
+    clear_parse_caches()
+    # 完成順序不固定 → 依 targets 原順序排好再印結果，log 與輸出 JSON 才穩定
+    data = {name: data[name] for name, _ in targets}
+    for name, df in data.items():
+        if name in errors:
+            print(f"[ERR] {name}: {errors[name]}")
+        else:
+            if name.startswith("ZGB_"):
+                print("[DBG]", name, "first10=", df["代號"].head(10).tolist())
             print(f"[OK] {name} rows={len(df)}")
-        except Exception as e:
-            print(f"[ERR] {name}: {e}")
-            data[name] = pd.DataFrame(columns=["代號", "名稱"])
 
         # ── 交集計算（支援 config.INTERSECTION_RULES；無設定則用預設規則） ──
     overlaps: Dict[str, List[Dict[str, str]]] = {}
@@ -175,8 +188,12 @@ def run_scraper(out_dir: str, date: str | None = None, simple: bool = False) ->
             "overlaps": overlaps,
         }
 
-    with open(outpath, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        with open(outpath, "wb") as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    else:
+        with open(outpath, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
 
     print(f"Saved JSON: {outpath}")
     return outpath
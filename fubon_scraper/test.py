@@ -2,7 +2,9 @@
 import os
 import json
 import datetime as dt
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce
+from typing import Dict, List, Tuple, Union
 
 import pandas as pd
 
@@ -31,19 +33,25 @@ def _assert_membership(inter_df: pd.DataFrame, parents: List[pd.DataFrame], labe
     return pd.DataFrame(keep, columns=["代號", "名稱"]).reset_index(drop=True)
 
 
+def _first_names(dfs: List[pd.DataFrame], codes: Union[set, pd.Index]) -> Dict[str, str]:
+    """codes 中每個代號取第一個非空名稱（依 dfs 順序、列順序）"""
+    frames = [df[["代號", "名稱"]] for df in dfs if not df.empty]
+    if not frames:
+        return {}
+    combined = pd.concat(frames, ignore_index=True).astype(str)
+    combined["名稱"] = combined["名稱"].str.strip()
+    combined = combined[combined["代號"].isin(codes) & (combined["名稱"] != "")]
+    combined = combined.drop_duplicates(subset="代號", keep="first")
+    return dict(zip(combined["代號"], combined["名稱"]))
+
+
 def _triple_intersection(a: pd.DataFrame, b: pd.DataFrame, c: pd.DataFrame) -> pd.DataFrame:
     """三集合交集"""
     sa, sb, sc = set(a["代號"]), set(b["代號"]), set(c["代號"])
     codes = sa & sb & sc
     if not codes:
         return pd.DataFrame(columns=["代號", "名稱"])
-    name_map: Dict[str, str] = {}
-    for df in (a, b, c):
-        for _, r in df.iterrows():
-            code = r["代號"]
-            nm = str(r["名稱"]).strip()
-            if code not in name_map and nm:
-                name_map[code] = nm
+    name_map = _first_names([a, b, c], codes)
     rows = [(code, name_map.get(code, "")) for code in sorted(codes)]
     return pd.DataFrame(rows, columns=["代號", "名稱"])
 
@@ -51,27 +59,24 @@ def _nway_intersection(dfs: List[pd.DataFrame]) -> pd.DataFrame:
     """N 個集合的交集（名稱以第一個出現者為準）。"""
     if not dfs:
         return pd.DataFrame(columns=["代號", "名稱"])
-    code_sets = [set(df["代號"]) for df in dfs if not df.empty]
-    if not code_sets:
+    # 交集在 pd.Index（C 層 hash table）上做，不必先為每個 df 建 Python set
+    code_idx = [pd.Index(df["代號"].astype(str).unique()) for df in dfs if not df.empty]
+    if not code_idx:
         return pd.DataFrame(columns=["代號", "名稱"])
-    inter_codes = set.intersection(*code_sets) if len(code_sets) > 1 else code_sets[0]
-    if not inter_codes:
+    inter_codes = reduce(lambda a, b: a.intersection(b), code_idx)
+    if inter_codes.empty:
         return pd.DataFrame(columns=["代號", "名稱"])
 
-    name_map: Dict[str, str] = {}
-    for df in dfs:
-        for _, r in df.iterrows():
-            code = str(r["代號"])
-            nm = str(r.get("名稱", "")).strip()
-            if code in inter_codes and code not in name_map and nm:
-                name_map[code] = nm
-    rows = [(code, name_map.get(code, "")) for code in sorted(inter_codes)]
+    name_map = _first_names(dfs, inter_codes)
+    rows = [(code, name_map.get(code, "")) for code in inter_codes.sort_values()]
     return pd.DataFrame(rows, columns=["代號", "名稱"])
 
 
 
 def _df_to_list(df: pd.DataFrame) -> List[Dict[str, str]]:
-    return [{"代號": str(r["代號"]), "名稱": str(r["名稱"])} for _, r in df.iterrows()]
+    codes = map(str, df["代號"].tolist())
+    names = map(str, df["名稱"].tolist())
+    return [{"代號": c, "名稱": n} for c, n in zip(codes, names)]
 
 
 def _scrape_group(name: str, url: str, session) -> pd.DataFrame:
@@ -83,13 +88,8 @@ def _scrape_group(name: str, url: str, session) -> pd.DataFrame:
     else:
         df = parse_codes_generic(html)
 
-    df = df[["代號", "名稱"]].copy()
-    df["代號"], df["名稱"] = df["代號"].astype(str), df["名稱"].astype(str)
-    df = df.dropna().drop_duplicates().reset_index(drop=True)
-
-    if name.startswith("ZGB_"):
-        print("[DBG]", name, "first10=", df["代號"].head(10).tolist())
-    return df
+    # extractor 輸出的兩欄已是字串，不再整欄 astype(str) 複製一份
+    return df[["代號", "名稱"]].dropna().drop_duplicates().reset_index(drop=True)
 
 
 def run_scraper(out_dir: str, date: str | None = None, simple: bool = False) -> str:
@@ -113,16 +113,28 @@ def run_scraper(out_dir: str, date: str | None = None, simple: bool = False) ->
         params = extra.get("params", {})
         targets.append((f"ZGB_{label}", build_zgb_url(params, target_date)))
 
-    # 抓取
+    # 抓取（多執行緒共用同一個 session；實際併發請求數由 utils._get 控管）
     data: Dict[str, pd.DataFrame] = {}
-    for name, url in targets:
-        try:
-            df = _scrape_group(name, url, session)
-            data[name] = df
+    errors: Dict[str, Exception] = {}
+    workers = max(1, min(getattr(config, "SCRAPE_WORKERS", 8), len(targets)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(_scrape_group, name, url, session): name for name, url in targets}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                data[name] = fut.result()
+            except Exception as e:
+                errors[name] = e
+                data[name] = pd.DataFrame(columns=["代號", "名稱"])
+    # 完成順序不固定 → 依 targets 原順序排好再印結果，log 與輸出 JSON 才穩定
+    data = {name: data[name] for name, _ in targets}
+    for name, df in data.items():
+        if name in errors:
+            print(f"[ERR] {name}: {errors[name]}")
+        else:
+            if name.startswith("ZGB_"):
+                print("[DBG]", name, "first10=", df["代號"].head(10).tolist())
             print(f"[OK] {name} rows={len(df)}")
-        except Exception as e:
-            print(f"[ERR] {name}: {e}")
-            data[name] = pd.DataFrame(columns=["代號", "名稱"])
 
         # ── 交集計算（支援 config.INTERSECTION_RULES；無設定則用預設規則） ──
     overlaps: Dict[str, List[Dict[str, str]]] = {}
@@ -1,31 +1,45 @@
 # fubon_scraper/utils.py
 import re
+import codecs
 import certifi
+import threading
 import urllib3
 import datetime as dt
+from pathlib import Path
 from typing import Optional, Dict
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlencode, urlparse, parse_qs
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
+# 台灣時區只建一次；無 zoneinfo / tzdata 時退回本機時間
 try:
     from zoneinfo import ZoneInfo
+    _TW_TZ = ZoneInfo("Asia/Taipei")
 except Exception:
-    ZoneInfo = None
+    _TW_TZ = None
+
+try:
+    import requests_cache
+except Exception:
+    requests_cache = None
 
 import config
 
 # 共用正則：4 碼股票代號
 RE_CODE = re.compile(r"(?<![0-9A-Za-zＡ-Ｚａ-ｚ])(\d{4,6}[A-Za-zＡ-Ｚａ-ｚ]?)(?![0-9A-Za-zＡ-Ｚａ-ｚ])")
+# <meta charset=...> / http-equiv Content-Type 內的字元集宣告（只看檔頭 bytes）
+RE_META_CHARSET = re.compile(rb"""charset\s*=\s*["']?([\w-]+)""", re.IGNORECASE)
+RE_DATE = re.compile(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})\s*$")
+
+# 各執行緒共用：同時進行中的 HTTP 請求上限，避免併發抓取時對目標站過度施壓
+_INFLIGHT = threading.BoundedSemaphore(getattr(config, "HTTP_MAX_INFLIGHT", 4))
 
 
 
 def tw_today() -> dt.date:
     """回傳台灣當地今日日期"""
-    if ZoneInfo is not None:
-        return dt.datetime.now(ZoneInfo("Asia/Taipei")).date()
-    return dt.datetime.now().date()
+    return dt.datetime.now(_TW_TZ).date()
 
 
 def parse_date_arg(s: Optional[str]) -> dt.date:
@@ -33,7 +47,7 @@ def parse_date_arg(s: Optional[str]) -> dt.date:
     if not s:
         return tw_today()
     s = s.strip().replace("/", "-").replace(".", "-")
-    m = re.match(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})\s*$", s)
+    m = RE_DATE.match(s)
     if not m:
         raise ValueError(f"無法解析日期：{s}")
     y, mo, d = map(int, m.groups())
@@ -41,8 +55,19 @@ def parse_date_arg(s: Optional[str]) -> dt.date:
 
 
 def requests_session() -> requests.Session:
-    """建立帶重試的 requests Session，套用預設 HEADERS"""
-    s = requests.Session()
+    """建立帶重試的 requests Session，套用預設 HEADERS（config.HTTP_CACHE_TTL > 0 時改用快取 Session）"""
+    ttl = getattr(config, "HTTP_CACHE_TTL", 0)
+    if ttl and requests_cache is not None:
+        s = requests_cache.CachedSession(
+            str(Path(config.OUT_DIR) / "http_cache"),
+            backend="sqlite",
+            expire_after=ttl,
+            allowable_methods=["GET"],
+        )
+    else:
+        if ttl:
+            print("⚠️ 未安裝 requests-cache，略過 HTTP 快取")
+        s = requests.Session()
     retries = Retry(
         total=5,
         backoff_factor=0.6,
@@ -50,39 +75,105 @@ def requests_session() -> requests.Session:
         allowed_methods=["GET", "HEAD"],
         raise_on_status=False,
     )
-    s.mount("https://", HTTPAdapter(max_retries=retries))
+    # 連線池大小對齊併發上限：所有 worker 的請求都能重用 keep-alive 連線，不會被丟棄重連
+    pool_size = max(getattr(config, "SCRAPE_WORKERS", 8), getattr(config, "HTTP_MAX_INFLIGHT", 4))
+    s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries))
     s.headers.update(config.HEADERS)
+    # CA bundle 只設一次，不在每次請求時重設
+    s.verify = certifi.where()
+    # fetch_html 用：同一 session 內 url -> HTML（買超/賣超的 ZGB 目標是同一頁）
+    s._html_cache = {}
+    s._html_locks = {}
     return s
 
 
 def _get(session: requests.Session, url: str, timeout: int = 25) -> requests.Response:
-    """優先驗證 SSL；失敗則降級為忽略驗證（避免目標站憑證異常時中斷）"""
+    """優先驗證 SSL；憑證驗證失敗才降級為忽略驗證（避免目標站憑證異常時中斷）"""
+    with _INFLIGHT:
+        try:
+            r = session.get(url, timeout=timeout)
+            r.raise_for_status()
+            return r
+        except requests.exceptions.SSLError:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            r = session.get(url, timeout=timeout, verify=False)
+            r.raise_for_status()
+            return r
+
+
+# 嚴格解碼會失敗的多位元組編碼（codecs 正規名稱）；latin-1/cp1252 等單位元組編碼任何 bytes 都「解得開」
+_MULTIBYTE_CHARSETS = {"big5", "big5hkscs", "cp950", "utf-8", "utf-8-sig"}
+
+
+def _codec_name(enc: Optional[str]) -> Optional[str]:
+    """編碼名稱正規化為 codecs 名稱；空值或不認得則 None"""
+    if not enc:
+        return None
     try:
-        session.verify = certifi.where()
-        r = session.get(url, timeout=timeout)
-        r.raise_for_status()
-        return r
-    except Exception:
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        r = session.get(url, timeout=timeout, verify=False)
-        r.raise_for_status()
-        return r
+        return codecs.lookup(enc).name
+    except LookupError:
+        return None
 
 
-def fetch_html(url: str, session: requests.Session) -> str:
-    """以多組編碼嘗試解碼，回傳 HTML 文字"""
-    r = _get(session, url, timeout=25)
-    encs = ["big5-hkscs", "big5", "cp950", r.apparent_encoding, r.encoding, "utf-8"]
-    for enc in [e for e in encs if e]:
+def _sniff_charset(raw: bytes) -> Optional[str]:
+    """從前 2KB 找頁面宣告的字元集（codecs 正規名稱，不認得則 None）；big5 一律換成相容且字更全的 big5-hkscs"""
+    m = RE_META_CHARSET.search(raw[:2048])
+    if not m:
+        return None
+    enc = _codec_name(m.group(1).decode("ascii"))
+    return "big5hkscs" if enc == "big5" else enc
+
+
+def _try_decode(raw: bytes, encs) -> Optional[str]:
+    """依序嚴格解碼，回傳第一個沒有替代字元且長度合理的結果"""
+    for enc in dict.fromkeys(e for e in encs if e):
         try:
-            r.encoding = enc
-            html = r.text
-            if "�" not in html and len(html) > 200:
-                return html
-        except Exception:
+            html = raw.decode(enc)
+        except UnicodeDecodeError:
             continue
-    r.encoding = "big5"
-    return r.text
+        if "�" not in html and len(html) > 200:
+            return html
+    return None
+
+
+def _fetch_html(url: str, session: requests.Session) -> str:
+    """以多組編碼嘗試解碼，回傳 HTML 文字（直接對 bytes 嚴格解碼，不經 r.text 反覆重解）"""
+    r = _get(session, url, timeout=25)
+    raw = r.content
+    declared = _sniff_charset(raw)
+    # Content-Type 沒帶 charset 時 requests 會給預設的 ISO-8859-1，不能當成可信的宣告
+    header = _codec_name(r.encoding)
+
+    # 1) 多位元組編碼：宣告錯誤時嚴格解碼會失敗，可以放心依序試；頁面宣告的排第一
+    multi = [e if e in _MULTIBYTE_CHARSETS else None for e in (declared, header)]
+    encs = [multi[0], "big5hkscs", "big5", "cp950", multi[1], "utf-8"]
+    html = _try_decode(raw, encs)
+    if html is not None:
+        return html
+
+    # 2) 都不合才做內容偵測（charset_normalizer，要掃全文、較貴），最後才試單位元組宣告（一定解得開、無法驗證）
+    tried = set(encs)
+    rest = (_codec_name(e) for e in (r.apparent_encoding, declared, header))
+    html = _try_decode(raw, [e for e in rest if e not in tried])
+    if html is not None:
+        return html
+    return raw.decode("big5", errors="replace")
+
+
+_HTML_LOCKS_GUARD = threading.Lock()
+
+
+def fetch_html(url: str, session: requests.Session) -> str:
+    """抓取並解碼 HTML；同一 session 內相同 URL 只抓一次（併發時後到者等待先到者的結果）"""
+    cache = getattr(session, "_html_cache", None)
+    if cache is None:
+        return _fetch_html(url, session)
+    with _HTML_LOCKS_GUARD:
+        lock = session._html_locks.setdefault(url, threading.Lock())
+    with lock:
+        if url not in cache:
+            cache[url] = _fetch_html(url, session)
+        return cache[url]
 
 
 def build_zgb_url(params: Dict[str, str], d: dt.date) -> str:
@@ -92,15 +183,14 @@ def build_zgb_url(params: Dict[str, str], d: dt.date) -> str:
     這裡一律以 `c=B`（張數）為預設，忽略外部傳入的 c，避免列表和你在頁面預設看到的不同。
     之後若要切換為金額，可另外新增參數 key（例如 metric="amt"）再由此轉換。
     """
-    y, m, da = d.year, d.month, d.day
     p = params.copy()
     # 強制使用張數榜 (B)，避免 config.c 造成與頁面不一致
     p.pop("c", None)
     p["c"] = "B"
     if not p.get("d"):
-        p.update({"e": f"{y}-{m}-{da}", "f": f"{y}-{m}-{da}"})
-    qs = "&".join([f"{k}={v}" for k, v in p.items()])
-    return f"{config.ZGB_BASE}?{qs}"
+        date_str = f"{d.year}-{d.month}-{d.day}"
+        p["e"] = p["f"] = date_str
+    return f"{config.ZGB_BASE}?{urlencode(p)}"
 
 
 
@@ -1,28 +1,56 @@
 # notifier/discord.py
 import json
-from typing import Iterable, Union, List, Dict, Tuple
+from typing import Iterable, Union, List, Dict, Tuple, Optional
 from urllib.parse import urlparse
 from datetime import datetime, timezone
 
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import config
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 # ── 外觀（可由 config 覆寫） ─────────────────────────────
 BOT_NAME = getattr(config, "DISCORD_BOT_NAME", "Fubon Scraper")
 BOT_AVATAR = getattr(config, "DISCORD_BOT_AVATAR", "")
 EMBED_COLOR = getattr(config, "DISCORD_EMBED_COLOR", 0x2ECC71)
 FOOTER_TEXT = getattr(config, "DISCORD_FOOTER_TEXT", "Fubon eBrokerDJ")
 
+# 共用 Session：同一輪的多張卡片重用 discord.com 的 TLS 連線
+# webhook POST 不是冪等：只重送「確定沒送達」的情況（連線失敗、429 依 Retry-After 退避）；
+# 讀取逾時 / 502 / 504 時 Discord 可能已發出卡片，重送會變成重複訊息，故不重試
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        connect=3,
+        read=0,
+        other=0,
+        backoff_factor=0.5,
+        status_forcelist=[429],
+        allowed_methods=["POST"],
+        raise_on_status=False,
+    ),
+))
+
 
 # ---------- 基礎工具 ----------
 def _chunk_lines(lines: List[str], max_chars: int = 1000) -> Iterable[str]:
+    """依 max_chars 把多行切成數塊（以 \n 串接）；curr 為目前塊的實際字數"""
     buf, curr = [], 0
     for ln in lines:
         ln = ln.rstrip()
-        need = len(ln) + (1 if buf else 0)
-        if curr + need > max_chars and buf:
-            yield "\n".join(buf); buf, curr = [], 0
-        buf.append(ln); curr += need
+        size = len(ln)
+        if buf and curr + 1 + size > max_chars:
+            yield "\n".join(buf)
+            buf, curr = [], 0
+        curr += size + (1 if buf else 0)
+        buf.append(ln)
     if buf:
         yield "\n".join(buf)
 
@@ -57,30 +85,33 @@ def _normalize_webhooks(w: Union[list, dict, str, None]) -> Union[List[str], Dic
 
 
 # ---------- 路由：把 embed 送到哪個 webhook ----------
-def _select_webhooks_for_name(name: str) -> List[str]:
+def _load_routes() -> Tuple[Union[List[str], Dict[str, str]], List[str]]:
+    """
+    讀取並正規化 webhook 設定（每次 send_discord 只做一次）。
+    回傳 (DISCORD_WEBHOOKS, DEFAULT_DISCORD_WEBHOOKS)；dict 會先依鍵名由長到短排好。
+    """
+    configured = _normalize_webhooks(getattr(config, "DISCORD_WEBHOOKS", []))
+    if isinstance(configured, dict):
+        configured = dict(sorted(configured.items(), key=lambda kv: (len(kv[0]), kv[0]), reverse=True))
+    defaults = _normalize_webhooks(getattr(config, "DEFAULT_DISCORD_WEBHOOKS", []))
+    return configured, (defaults if isinstance(defaults, list) else [])
+
+
+def _select_webhooks_for_name(name: str, routes: Optional[tuple] = None) -> List[str]:
     """
     若 DISCORD_WEBHOOKS 是 dict：以「鍵名出現在 name 中」來路由，採最長匹配（更精準）。
     若是 list：回傳整個清單（全部廣播）。
     若沒命中任何鍵，使用 DEFAULT_DISCORD_WEBHOOKS（可空）。
     """
-    configured = _normalize_webhooks(getattr(config, "DISCORD_WEBHOOKS", []))
+    configured, defaults = routes or _load_routes()
     if isinstance(configured, list):
         return configured[:]  # 廣播
-    elif isinstance(configured, dict):
-        # 最長鍵名優先
-        matches: List[Tuple[int, str]] = []
-        for key in configured.keys():
-            if key and key in name:
-                matches.append((len(key), key))
-        if matches:
-            matches.sort(reverse=True)  # 長的優先
-            key = matches[0][1]
-            return [configured[key]]
-        # 沒命中 → 回預設
-        defaults = _normalize_webhooks(getattr(config, "DEFAULT_DISCORD_WEBHOOKS", []))
-        return defaults if isinstance(defaults, list) else []
-    else:
-        return []
+    # 鍵已依長度排序 → 第一個命中的就是最長匹配
+    for key, url in configured.items():
+        if key and key in name:
+            return [url]
+    # 沒命中 → 回預設
+    return defaults[:]
 
 
 # ---------- 產生 embed（每個交集一張卡，列出完整清單） ----------
@@ -105,9 +136,17 @@ def _build_embed_for_overlap(name: str, items: List[dict], date_str: str) -> dic
     }
 
 
-def send_discord(json_path: str) -> None:
+def _load_json(json_path: str) -> dict:
+    """讀取爬蟲輸出 JSON；有安裝 orjson 時直接解析 bytes，否則退回標準 json"""
+    if orjson is not None:
+        with open(json_path, "rb") as f:
+            return orjson.loads(f.read())
     with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        return json.load(f)
+
+
+def send_discord(json_path: str) -> None:
+    data = _load_json(json_path)
 
     date_str = data.get("date") or data.get("summary", {}).get("date_for_zgb", "")
     overlaps = data.get("overlaps") or {}
@@ -116,9 +155,10 @@ def send_discord(json_path: str) -> None:
         return
 
     # 逐交集 → 依規則路由到對應 webhook
+    routes = _load_routes()
     for name, items in overlaps.items():
         embed = _build_embed_for_overlap(name, items, date_str)
-        webhooks = _select_webhooks_for_name(name)
+        webhooks = _select_webhooks_for_name(name, routes)
 
         if not webhooks:
             print(f"ℹ️ {name} 沒有匹配到任何 webhook（也無預設），略過發送。")
@@ -131,7 +171,7 @@ def send_discord(json_path: str) -> None:
                     **({"avatar_url": BOT_AVATAR} if BOT_AVATAR else {}),
                     "embeds": [embed],
                 }
-                r = requests.post(url, json=payload, timeout=20)
+                r = _SESSION.post(url, json=payload, timeout=20)
                 if r.status_code >= 400:
                     try:
                         detail = r.json()